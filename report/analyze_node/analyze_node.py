@@ -19,7 +19,6 @@ import sys
 import os
 from pathlib import Path
 import argparse
-from distutils.util import strtobool
 import logging
 import math
 import yaml
@@ -32,7 +31,7 @@ from caret_analyze.runtime.callback import CallbackBase, CallbackType
 from caret_analyze.plot import Plot
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
 from common.utils import create_logger, make_destination_dir, read_trace_data, export_graph, trail_df
-from common.utils import round_yaml, get_callback_legend
+from common.utils import round_yaml, get_callback_legend, strtobool
 from common.utils import ComponentManager
 
 # Suppress log for CARET
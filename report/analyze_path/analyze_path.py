@@ -21,16 +21,28 @@ import datetime
 import pathlib
 import shutil
 import argparse
-from distutils.util import strtobool
+import functools
+import dataclasses
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
 import logging
 import json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 import yaml
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
 import numpy as np
-from caret_analyze.record import RecordsInterface
+import pandas as pd
 from caret_analyze import Architecture, Application, Lttng
+from caret_analyze.runtime.path import Path
 from caret_analyze.plot import Plot
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
-from common.utils import create_logger, make_destination_dir, read_trace_data, export_graph, round_yaml
+from common.utils import create_logger, make_destination_dir, read_trace_data, export_graph, round_yaml, strtobool
 
 # Suppress log for CARET
 from logging import getLogger, FATAL
@@ -42,54 +54,61 @@ import warnings
 warnings.simplefilter("ignore")
 
 _logger: logging.Logger = None
+_worker_arch_app: tuple[Architecture, Application] = None
 
 
+@dataclass
 class Stats():
-    def __init__(self, target_path_name: str, node_names: list[str]):
-        self.target_path_name = target_path_name
-        self.node_names = node_names
-        self.best_avg = '---'
-        self.best_std = '---'
-        self.best_min = '---'
-        self.best_max = '---'
-        self.best_p50 = '---'
-        self.best_p95 = '---'
-        self.best_p99 = '---'
-        self.worst_avg = '---'
-        self.worst_std = '---'
-        self.worst_min = '---'
-        self.worst_max = '---'
-        self.worst_p50 = '---'
-        self.worst_p95 = '---'
-        self.worst_p99 = '---'
-        self.filename_messageflow = ''
-        self.filename_messageflow_short = ''
-        self.filename_hist_total = ''
-        self.filename_hist_best = ''
-        self.filename_timeseries_best = ''
-        self.filename_stacked_bar_best = ''
-        self.filename_hist_worst = ''
-        self.filename_timeseries_worst = ''
-        self.filename_stacked_bar_worst = ''
+    target_path_name: str
+    node_names: list[str]
+    best_avg: float | str = '---'
+    best_std: float | str = '---'
+    best_min: float | str = '---'
+    best_max: float | str = '---'
+    best_p50: float | str = '---'
+    best_p95: float | str = '---'
+    best_p99: float | str = '---'
+    worst_avg: float | str = '---'
+    worst_std: float | str = '---'
+    worst_min: float | str = '---'
+    worst_max: float | str = '---'
+    worst_p50: float | str = '---'
+    worst_p95: float | str = '---'
+    worst_p99: float | str = '---'
+    filename_messageflow: str = ''
+    filename_messageflow_short: str = ''
+    filename_hist_total: str = ''
+    filename_hist_best: str = ''
+    filename_timeseries_best: str = ''
+    filename_stacked_bar_best: str = ''
+    filename_hist_worst: str = ''
+    filename_timeseries_worst: str = ''
+    filename_stacked_bar_worst: str = ''
 
     def calc_stats(self, df_best: np.ndarray, df_worst: np.ndarray):
-        self.best_avg = round(float(np.average(df_best)), 3)
-        if len(df_best) > 1:
-            self.best_min = round(float(np.min(df_best)), 3)
-            self.best_max = round(float(np.max(df_best)), 3)
-            self.best_std = round(float(np.std(df_best)), 3)
-            self.best_p50 = round(float(np.quantile(df_best, 0.5)), 3)
-            self.best_p95 = round(float(np.quantile(df_best, 0.95)), 3)
-            self.best_p99 = round(float(np.quantile(df_best, 0.99)), 3)
-
-        self.worst_avg = round(float(np.average(df_worst)), 3)
-        if len(df_worst) > 1:
-            self.worst_min = round(float(np.min(df_worst)), 3)
-            self.worst_std = round(float(np.std(df_worst)), 3)
-            self.worst_max = round(float(np.max(df_worst)), 3)
-            self.worst_p50 = round(float(np.quantile(df_worst, 0.5)), 3)
-            self.worst_p95 = round(float(np.quantile(df_worst, 0.95)), 3)
-            self.worst_p99 = round(float(np.quantile(df_worst, 0.99)), 3)
+        arr_best = np.ascontiguousarray(df_best, dtype=np.float64)
+        num_best = arr_best.size
+        self.best_avg = round(float(arr_best.mean()), 3)
+        if num_best > 1:
+            self.best_min = round(float(arr_best.min()), 3)
+            self.best_max = round(float(arr_best.max()), 3)
+            self.best_std = round(float(arr_best.std()), 3)
+            p50, p95, p99 = np.quantile(arr_best, [0.5, 0.95, 0.99])
+            self.best_p50 = round(float(p50), 3)
+            self.best_p95 = round(float(p95), 3)
+            self.best_p99 = round(float(p99), 3)
+
+        arr_worst = np.ascontiguousarray(df_worst, dtype=np.float64)
+        num_worst = arr_worst.size
+        self.worst_avg = round(float(arr_worst.mean()), 3)
+        if num_worst > 1:
+            self.worst_min = round(float(arr_worst.min()), 3)
+            self.worst_std = round(float(arr_worst.std()), 3)
+            self.worst_max = round(float(arr_worst.max()), 3)
+            p50, p95, p99 = np.quantile(arr_worst, [0.5, 0.95, 0.99])
+            self.worst_p50 = round(float(p50), 3)
+            self.worst_p95 = round(float(p95), 3)
+            self.worst_p99 = round(float(p99), 3)
 
     def store_filename(self, target_path_name: str, save_long_graph: bool):
         if save_long_graph:
@@ -103,9 +122,8 @@ class Stats():
         self.filename_stacked_bar_worst = f'{target_path_name}_stacked_bar_worst'
 
 
-def get_messageflow_durationtime(records: RecordsInterface, check_by_input: bool = True):
+def get_messageflow_durationtime(df_records: pd.DataFrame, check_by_input: bool = True):
     """Get duration time [sec] of message flow"""
-    df_records = records.to_dataframe()
     try:
         input_column = df_records.columns[0]
         input_time_min = df_records[input_column].min()
@@ -125,8 +143,7 @@ def get_messageflow_durationtime(records: RecordsInterface, check_by_input: bool
     return duration
 
 
-def check_the_first_last_callback_is_valid(records: RecordsInterface):
-    df_records = records.to_dataframe()
+def check_the_first_last_callback_is_valid(df_records: pd.DataFrame):
     is_first_valid = True
     is_last_valid = True
     if len(df_records[df_records.columns[0]]) == 0:
@@ -139,25 +156,27 @@ def check_the_first_last_callback_is_valid(records: RecordsInterface):
     return is_first_valid, is_last_valid
 
 
-def analyze_path(args, dest_dir: str, arch: Architecture, app: Application, target_path_name: str, include_first_last_callback: dict, xaxis_type: str):
+def analyze_path(args, dest_dir: str, target_path: Path, node_names: list[str], include_first_last_callback: dict, xaxis_type: str):
     """Analyze a path"""
+    target_path_name = target_path.path_name
     _logger.info(f'Processing: {target_path_name}')
-    target_path = app.get_path(target_path_name)
 
     # Include the first and last callback if availble
     target_path.include_first_callback = include_first_last_callback[target_path_name][0]
     target_path.include_last_callback = include_first_last_callback[target_path_name][1]
-    records = target_path.to_records()
-    is_first_valid, is_last_valid = check_the_first_last_callback_is_valid(records)
-    if (not is_first_valid) or (not is_last_valid):
+    df_records = target_path.to_records().to_dataframe()
+    is_first_valid, is_last_valid = check_the_first_last_callback_is_valid(df_records)
+    if ((not is_first_valid) or (not is_last_valid)) and \
+            (is_first_valid, is_last_valid) != include_first_last_callback[target_path_name]:
+        # Re-create records only when the flags are actually changed
         target_path.include_first_callback = is_first_valid
         target_path.include_last_callback = is_last_valid
-        records = target_path.to_records()
+        df_records = target_path.to_records().to_dataframe()
 
-    stats = Stats(target_path_name, arch.get_path(target_path_name).node_names)
+    stats = Stats(target_path_name, node_names)
 
     _logger.info('  message flow')
-    duration = get_messageflow_durationtime(records)
+    duration = get_messageflow_durationtime(df_records)
     if duration is None:
         _logger.warning(f'    No-traffic and No-input in the path: {target_path_name}')
         return stats
@@ -175,17 +194,17 @@ def analyze_path(args, dest_dir: str, arch: Architecture, app: Application, targ
         export_graph(graph, dest_dir, f'{target_path_name}_messageflow', target_path_name, with_png=False)
 
     _logger.info('  response time')
-    if get_messageflow_durationtime(records, check_by_input=False) is None:
+    if get_messageflow_durationtime(df_records, check_by_input=False) is None:
         _logger.warning(f'    No-traffic in the path: {target_path_name}')
     else:
         df_response_time = {}
-        for case_str in ['best', 'worst', 'all']:
+        case_list = ['best', 'worst'] + (['all'] if args.include_all_case else [])
+        for case_str in case_list:
             plot_timeseries = Plot.create_response_time_timeseries_plot(target_path, case=case_str)
-            plot_timeseries.to_dataframe(
-                xaxis_type=xaxis_type).to_csv(
-                f'{dest_dir}/{target_path_name}_response_time_{case_str}.csv')
+            df_timeseries = plot_timeseries.to_dataframe(xaxis_type=xaxis_type)
+            df_timeseries.to_csv(f'{dest_dir}/{target_path_name}_response_time_{case_str}.csv')
             fig_timeseries = plot_timeseries.figure(full_legends=False, xaxis_type=xaxis_type)
-            df_response_time[case_str] = plot_timeseries.to_dataframe(xaxis_type=xaxis_type)
+            df_response_time[case_str] = df_timeseries
             fig_hist = Plot.create_response_time_histogram_plot(target_path, case=case_str).figure(full_legends=False, xaxis_type=xaxis_type)
             fig_timeseries.y_range.start = 0
             fig_timeseries.legend.visible = False
@@ -201,37 +220,73 @@ def analyze_path(args, dest_dir: str, arch: Architecture, app: Application, targ
             except Exception as e:
                 _logger.warning(f'    Failed to create stacked bar graph: {target_path_name}, {case_str}')
                 _logger.warning(str(e))
-        stats.calc_stats(df_response_time['best'].iloc[:, 1], df_response_time['worst'].iloc[:, 1])
+        stats.calc_stats(df_response_time['best'].iloc[:, 1].to_numpy(dtype=np.float64, copy=False),
+                         df_response_time['worst'].iloc[:, 1].to_numpy(dtype=np.float64, copy=False))
 
     stats.store_filename(target_path_name, args.message_flow)
     _logger.info(f'---{target_path_name}---')
-    _logger.debug(vars(stats))
+    _logger.debug(dataclasses.asdict(stats))
 
     return stats
 
 
+def init_worker(args):
+    """Load trace data once per worker process"""
+    global _logger
+    global _worker_arch_app
+    if _logger is None:
+        _logger = create_logger(__name__, logging.DEBUG if args.verbose else logging.INFO)
+    lttng = read_trace_data(args.trace_data[0], args.start_strip, args.end_strip, False)
+    arch = Architecture('yaml', args.architecture_file_path)
+    app = Application(arch, lttng)
+    _worker_arch_app = (arch, app)
+
+
+def analyze_path_worker(args, dest_dir: str, include_first_last_callback: dict, xaxis_type: str, target_path_name: str):
+    """Analyze a path in a worker process"""
+    arch, app = _worker_arch_app
+    return analyze_path(args, dest_dir, app.get_path(target_path_name), arch.get_path(target_path_name).node_names,
+                        include_first_last_callback, xaxis_type)
+
+
 def get_include_first_last_callback(args, arch: Architecture):
     include_first_last_callback = {}
     for target_path in arch.paths:
         target_path_name = target_path.path_name
         include_first_last_callback[target_path_name] = (True, True)
 
-    def modify_dictionary(dictionary, target_string, new_value):
-        for key in dictionary:
+    # Path names in the architecture may have a suffix (e.g. "_0"), so match by substring
+    path_name_list = list(include_first_last_callback.keys())
+
+    def modify_dictionary(dictionary, key_list, target_string, new_value):
+        for key in key_list:
             if target_string in key:
                 dictionary[key] = new_value
 
-    with open(args.target_path_json, encoding='UTF-8') as f_json:
-        target_path_json = json.load(f_json)
-        for target_path in target_path_json['target_path_list']:
-            target_path_name = target_path['name']
-            include_first_callback = target_path['include_first_callback'] if 'include_first_callback' in target_path else True
-            include_last_callback = target_path['include_last_callback'] if 'include_last_callback' in target_path else True
-            modify_dictionary(include_first_last_callback, target_path_name, (include_first_callback, include_last_callback))
+    if orjson is not None:
+        target_path_json = orjson.loads(pathlib.Path(args.target_path_json).read_bytes())
+    else:
+        with open(args.target_path_json, encoding='UTF-8') as f_json:
+            target_path_json = json.load(f_json)
+    for target_path in target_path_json['target_path_list']:
+        target_path_name = target_path['name']
+        include_first_callback = target_path['include_first_callback'] if 'include_first_callback' in target_path else True
+        include_last_callback = target_path['include_last_callback'] if 'include_last_callback' in target_path else True
+        modify_dictionary(include_first_last_callback, path_name_list, target_path_name, (include_first_callback, include_last_callback))
 
     return include_first_last_callback
 
 
+def save_stats(f_yaml, stats_values: dict[str, np.ndarray], index: int, stats: Stats):
+    """Append stats of a path to the stats file, and store values for summary"""
+    yaml.dump([dataclasses.asdict(stats)], f_yaml, Dumper=SafeDumper, encoding='utf-8', allow_unicode=True, sort_keys=False)
+    f_yaml.flush()
+    for value_name, values in stats_values.items():
+        value = getattr(stats, value_name)
+        if isinstance(value, (int, float)):
+            values[index] = value
+
+
 def analyze(args, lttng: Lttng, arch: Architecture, app: Application, dest_dir: str):
     """Analyze paths"""
     global _logger
@@ -243,30 +298,45 @@ def analyze(args, lttng: Lttng, arch: Architecture, app: Application, dest_dir:
     shutil.copy(args.architecture_file_path, dest_dir)
 
     include_first_last_callback = get_include_first_last_callback(args, arch)
-
-    stats_list = []
+    arch_paths = {target_path.path_name: target_path for target_path in arch.paths}
+    path_names = list(arch_paths.keys())
 
     # Verify each path
-    for target_path in arch.paths:
-        target_path_name = target_path.path_name
-        path = arch.get_path(target_path_name)
-        ret_verify = path.verify()
+    for target_path_name, target_path in arch_paths.items():
+        ret_verify = target_path.verify()
         _logger.info(f'path.verify {target_path_name}: {ret_verify}')
         if not ret_verify:
             sys.exit(-1)
 
-    # Analyze each path
-    for target_path in arch.paths:
-        target_path_name = target_path.path_name
-        stats = analyze_path(args, dest_dir, arch, app, target_path_name, include_first_last_callback, xaxis_type)
-        stats_list.append(vars(stats))
+    # Values used for cross-path summary (NaN if not available)
+    stats_values = {value_name: np.full(len(path_names), np.nan) for value_name in ['best_avg', 'worst_max']}
 
-    # Save stats file
+    # Analyze each path, and append its stats to the stats file as soon as it's available
     stat_file_path = f'{dest_dir}/stats_path.yaml'
     with open(stat_file_path, 'w', encoding='utf-8') as f_yaml:
-        yaml.safe_dump(stats_list, f_yaml, encoding='utf-8', allow_unicode=True, sort_keys=False)
+        if not path_names:
+            yaml.dump([], f_yaml, Dumper=SafeDumper, encoding='utf-8', allow_unicode=True)
+        elif args.jobs > 1 and len(path_names) > 1:
+            with ProcessPoolExecutor(max_workers=min(args.jobs, len(path_names)),
+                                     initializer=init_worker, initargs=(args,)) as executor:
+                stats_iter = executor.map(functools.partial(analyze_path_worker, args, dest_dir,
+                                                            include_first_last_callback, xaxis_type),
+                                          path_names)
+                for index, stats in enumerate(stats_iter):
+                    save_stats(f_yaml, stats_values, index, stats)
+        else:
+            app_paths = {target_path_name: app.get_path(target_path_name) for target_path_name in path_names}
+            for index, target_path_name in enumerate(path_names):
+                stats = analyze_path(args, dest_dir, app_paths[target_path_name], arch_paths[target_path_name].node_names,
+                                     include_first_last_callback, xaxis_type)
+                save_stats(f_yaml, stats_values, index, stats)
     round_yaml(stat_file_path)
 
+    if len(path_names) > 0:
+        _logger.info(f'Paths with valid response time: {np.count_nonzero(~np.isnan(stats_values["best_avg"]))} / {len(path_names)}')
+        _logger.info(f'Average of best_avg: {np.nanmean(stats_values["best_avg"]):.3f}, '
+                     f'Max of worst_max: {np.nanmax(stats_values["worst_max"]):.3f}')
+
     _logger.info('<<< Analyze Paths: Finish >>>')
 
 
@@ -280,11 +350,15 @@ def parse_arg():
     parser.add_argument('--architecture_file_path', type=str, default='architecture_path.yaml')
     parser.add_argument('-m', '--message_flow', type=strtobool, default=False,
                         help='Output message flow graph')
+    parser.add_argument('--include_all_case', type=strtobool, default=False,
+                        help='Output response time graphs for "all" case in addition to "best" and "worst"')
     parser.add_argument('--start_strip', type=float, default=0.0,
                         help='Start strip [sec] to load trace data')
     parser.add_argument('--end_strip', type=float, default=0.0,
                         help='End strip [sec] to load trace data')
     parser.add_argument('--sim_time', type=strtobool, default=False)
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of processes to analyze paths in parallel')
     parser.add_argument('-f', '--force', action='store_true', default=False,
                         help='Overwrite report directory')
     parser.add_argument('-v', '--verbose', action='store_true', default=False)
@@ -304,8 +378,11 @@ def main():
     _logger.debug(f'architecture_file_path: {args.architecture_file_path}')
     _logger.debug(f'start_strip: {args.start_strip}, end_strip: {args.end_strip}')
     _logger.debug(f'sim_time: {args.sim_time}')
+    _logger.debug(f'jobs: {args.jobs}')
     args.message_flow = True if args.message_flow == 1 else False
     _logger.debug(f'message_flow: {args.message_flow}')
+    args.include_all_case = True if args.include_all_case == 1 else False
+    _logger.debug(f'include_all_case: {args.include_all_case}')
 
     lttng = read_trace_data(args.trace_data[0], args.start_strip, args.end_strip, False)
     arch = Architecture('yaml', args.architecture_file_path)
@@ -34,6 +34,18 @@ from bokeh.resources import CDN
 from bokeh.io import export_png
 
 
+_STR_TO_BOOL = {'y': 1, 'yes': 1, 't': 1, 'true': 1, 'on': 1, '1': 1,
+                'n': 0, 'no': 0, 'f': 0, 'false': 0, 'off': 0, '0': 0}
+
+
+def strtobool(val: str) -> int:
+    """Convert a string representation of truth to 1 or 0 (replacement of distutils.util.strtobool)"""
+    try:
+        return _STR_TO_BOOL[val.lower()]
+    except KeyError:
+        raise ValueError(f'invalid truth value {val!r}') from None
+
+
 def create_logger(name, level: int=logging.DEBUG, log_filename: str=None) -> logging.Logger:
     """Create logger"""
     handler_format = logging.Formatter(
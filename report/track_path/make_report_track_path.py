@@ -17,7 +17,6 @@ Script to make report page
 import os
 import sys
 import argparse
-from distutils.util import strtobool
 from pathlib import Path
 import glob
 import math
@@ -33,6 +32,8 @@ from bokeh.plotting import figure, save
 from bokeh.models import FixedTicker
 from bokeh.resources import CDN
 import flask
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
+from common.utils import strtobool
 
 _logger = logging.Logger(__name__)
 app = flask.Flask(__name__)
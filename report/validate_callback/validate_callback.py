@@ -19,7 +19,6 @@ import sys
 import os
 from pathlib import Path
 import argparse
-from distutils.util import strtobool
 import logging
 import re
 from itertools import groupby
@@ -33,7 +32,7 @@ from caret_analyze.runtime.callback import CallbackBase, CallbackType
 from caret_analyze.plot import Plot
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
 from common.utils import create_logger, make_destination_dir, read_trace_data, export_graph, trail_df, get_callback_legend
-from common.utils import ComponentManager
+from common.utils import ComponentManager, strtobool
 from common.utils_validation import Metrics, ResultStatus
 
 # Suppress log for CARET
@@ -20,7 +20,6 @@ import os
 from enum import Enum
 from pathlib import Path
 import argparse
-from distutils.util import strtobool
 import logging
 import re
 import copy
@@ -36,7 +35,7 @@ from caret_analyze.runtime.communication import Communication, Subscription, Pub
 from caret_analyze.plot import Plot
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
 from common.utils import create_logger, make_destination_dir, read_trace_data, export_graph, trail_df
-from common.utils import ComponentManager
+from common.utils import ComponentManager, strtobool
 from common.utils_validation import Metrics, ResultStatus
 
 